@@ -1,16 +1,64 @@
-from django.contrib import admin
-from django.db.models import Count, Sum, Case, When, IntegerField
-from .models import ElectiveType, Course, StudentSelection
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ERROR_FLAG, IGNORED_PARAMS, PAGE_VAR, SEARCH_VAR
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+from .catalog import catalog_changes
+from .exports import with_point_totals
+from .jobs import enqueue, requeue_jobs
+from .models import ElectiveType, Course, StudentSelection, Job, RequestProfile
+from .summary import invalidate_student_summaries, invalidate_student_summary
+
+
+def _job_scope(request, queryset):
+    """
+    Describe an action's rows for a background job. With "select all" that
+    is the changelist's filters and search, not every primary key; otherwise
+    the rows ticked on the current page.
+    """
+    if request.POST.get('select_across') == '1':
+        filters = {
+            key: value for key, value in request.GET.items()
+            if key not in (*IGNORED_PARAMS, PAGE_VAR, ERROR_FLAG) or key == SEARCH_VAR
+        }
+        return {'scope': 'all', 'filters': filters}
+    return {'scope': 'selected', 'ids': list(queryset.values_list('pk', flat=True))}
+
+
+def _job_queued(modeladmin, request, job):
+    url = reverse('admin:courses_job_change', args=[job.pk])
+    modeladmin.message_user(
+        request,
+        format_html('Queued <a href="{}">{}</a>. The file will be ready to download from the job page.', url, job),
+        messages.SUCCESS,
+    )
+
+
+class CatalogAdminMixin:
+    """Bump the catalog version once per admin save, delete or bulk action"""
+
+    def changeform_view(self, *args, **kwargs):
+        with catalog_changes():
+            return super().changeform_view(*args, **kwargs)
+
+    def delete_view(self, *args, **kwargs):
+        with catalog_changes():
+            return super().delete_view(*args, **kwargs)
+
+    def changelist_view(self, *args, **kwargs):
+        with catalog_changes():
+            return super().changelist_view(*args, **kwargs)
 
 
 @admin.register(ElectiveType)
-class ElectiveTypeAdmin(admin.ModelAdmin):
+class ElectiveTypeAdmin(CatalogAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'description']
     search_fields = ['name']
 
 
 @admin.register(Course)
-class CourseAdmin(admin.ModelAdmin):
+class CourseAdmin(CatalogAdminMixin, admin.ModelAdmin):
     list_display = ['code', 'name', 'credits', 'level', 'total_preference_points', 'selection_count']
     list_filter = ['elective_types', 'level', 'credits']
     search_fields = ['code', 'name', 'description']
@@ -19,18 +67,7 @@ class CourseAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.annotate(
-            _total_points=Sum(
-                Case(
-                    When(selections__interest='not_willing', then=0),
-                    When(selections__interest='willing', then=1),
-                    When(selections__interest='prefer', then=2),
-                    default=0,
-                    output_field=IntegerField()
-                )
-            ),
-            _selection_count=Count('selections')
-        )
+        return with_point_totals(qs)
 
     def total_preference_points(self, obj):
         return obj._total_points or 0
@@ -43,29 +80,8 @@ class CourseAdmin(admin.ModelAdmin):
     selection_count.admin_order_field = '_selection_count'
 
     def export_courses_with_points(self, request, queryset):
-        import csv
-        from django.http import HttpResponse
-
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="courses_with_points.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow(['Course Code', 'Course Name', 'Credits', 'Level', 'Total Points', 'Total Selections'])
-
-        # Sort by total points (descending)
-        sorted_queryset = sorted(queryset, key=lambda x: x._total_points or 0, reverse=True)
-
-        for course in sorted_queryset:
-            writer.writerow([
-                course.code,
-                course.name,
-                course.credits,
-                course.level,
-                course._total_points or 0,
-                course._selection_count or 0,
-            ])
-
-        return response
+        job = enqueue('export_courses_with_points', **_job_scope(request, queryset))
+        _job_queued(self, request, job)
 
     export_courses_with_points.short_description = "Export courses with point totals (sorted by points)"
 
@@ -85,30 +101,131 @@ class StudentSelectionAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         return qs.select_related('course', 'elective_type')
 
-    # Add custom action to export selections
-    actions = ['export_as_csv']
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_student_summary(obj.student_id)
 
-    def export_as_csv(self, request, queryset):
-        import csv
-        from django.http import HttpResponse
+    def delete_queryset(self, request, queryset):
+        student_ids = set(queryset.values_list('student_id', flat=True))
+        super().delete_queryset(request, queryset)
+        invalidate_student_summaries(student_ids)
 
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="student_selections.csv"'
+    # Add custom action to export selections
+    actions = ['export_as_csv', 'export_preference_matrix']
 
-        writer = csv.writer(response)
-        writer.writerow(['Student ID', 'Course Code', 'Course Name', 'Elective Type', 'Interest', 'Points', 'Date'])
+    def export_as_csv(self, request, queryset):
+        job = enqueue('export_selections_csv', **_job_scope(request, queryset))
+        _job_queued(self, request, job)
 
-        for selection in queryset:
-            writer.writerow([
-                selection.student_id,
-                selection.course.code,
-                selection.course.name,
-                selection.elective_type.name,
-                selection.get_interest_display(),
-                selection.points,
-                selection.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
+    export_as_csv.short_description = "Export selected as CSV"
 
-        return response
+    def export_preference_matrix(self, request, queryset):
+        job = enqueue('export_preference_matrix', **_job_scope(request, queryset))
+        _job_queued(self, request, job)
+
+    export_preference_matrix.short_description = "Export selected as preference matrix (.npz)"
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'kind', 'status', 'progress_display', 'created_at', 'finished_at', 'download_link']
+    list_filter = ['kind', 'status']
+    readonly_fields = ['kind', 'params', 'status', 'progress', 'total', 'message', 'download_link',
+                       'created_at', 'started_at', 'finished_at']
+    exclude = ['result']
+    actions = ['requeue']
+
+    def has_add_permission(self, request):
+        return False
+
+    def requeue(self, request, queryset):
+        requeued = requeue_jobs(queryset)
+        self.message_user(request, f'Requeued {requeued} running job(s).', messages.SUCCESS)
+
+    requeue.short_description = "Requeue selected running jobs (after the job runner died)"
+
+    def progress_display(self, obj):
+        if obj.total:
+            return f'{obj.progress} / {obj.total}'
+        return obj.progress or ''
+    progress_display.short_description = 'Progress'
+
+    def download_link(self, obj):
+        if not obj.result:
+            return ''
+        url = reverse('admin:courses_job_download', args=[obj.pk])
+        return format_html('<a href="{}">Download</a>', url)
+    download_link.short_description = 'Result'
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download),
+                 name='courses_job_download'),
+        ] + super().get_urls()
+
+    def download(self, request, pk):
+        job = get_object_or_404(Job, pk=pk)
+        if not self.has_view_permission(request, job) or not job.result:
+            raise Http404
+        filename = job.result.name.rsplit('/', 1)[-1].split('-', 1)[-1]
+        return FileResponse(job.result.open('rb'), as_attachment=True, filename=filename)
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ['path', 'view_name', 'method', 'status_code', 'trigger', 'duration_ms',
+                    'query_count', 'query_ms', 'sample_count', 'created_at']
+    list_filter = ['trigger', 'view_name', 'method']
+    search_fields = ['path', 'view_name']
+    readonly_fields = ['path', 'view_name', 'method', 'status_code', 'trigger', 'duration_ms',
+                       'sample_count', 'query_count', 'query_ms', 'stacks_link', 'top_stacks',
+                       'sql_timeline', 'created_at']
+    exclude = ['stacks', 'queries']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def stacks_link(self, obj):
+        url = reverse('admin:courses_requestprofile_stacks', args=[obj.pk])
+        return format_html('<a href="{}">Download collapsed stacks</a> (open in speedscope or flamegraph.pl)', url)
+    stacks_link.short_description = 'Flame graph'
+
+    def top_stacks(self, obj):
+        try:
+            with obj.stacks.open('r') as f:
+                lines = [line.rsplit(' ', 1) for line in f.read().splitlines()[:10]]
+        except (OSError, ValueError):
+            return 'The stacks file is missing.'
+        return format_html(
+            '<table>{}</table>',
+            format_html_join('', '<tr><td>{}</td><td>{}</td></tr>',
+                             ((count, ' → '.join(stack.split(';')[-3:])) for stack, count in lines)),
+        )
+    top_stacks.short_description = 'Hottest stacks (innermost frames)'
 
-    export_as_csv.short_description = "Export selected as CSV"
+    def sql_timeline(self, obj):
+        return format_html(
+            '<table><tr><th>Start (ms)</th><th>Duration (ms)</th><th>SQL</th></tr>{}</table>',
+            format_html_join('', '<tr><td>{}</td><td>{}</td><td><code>{}</code></td></tr>',
+                             ((q['start_ms'], q['duration_ms'], q['sql']) for q in obj.queries)),
+        )
+    sql_timeline.short_description = 'SQL timeline'
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/stacks/', self.admin_site.admin_view(self.download_stacks),
+                 name='courses_requestprofile_stacks'),
+        ] + super().get_urls()
+
+    def download_stacks(self, request, pk):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if not self.has_view_permission(request, profile):
+            raise Http404
+        try:
+            stacks = profile.stacks.open('rb')
+        except (OSError, ValueError):
+            raise Http404('The stacks file is missing.')
+        return FileResponse(stacks, as_attachment=True, filename=f'profile-{profile.pk}.collapsed')
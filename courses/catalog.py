@@ -0,0 +1,106 @@
+"""
+Per-worker immutable snapshot of the course catalog.
+
+Courses and elective types almost never change, so each worker loads them
+once into plain tuples and reuses them for every request, reloading only when
+CatalogVersion has been bumped (by the signals in courses/signals.py, which
+fire on admin saves and load_courses). Bulk writers wrap their changes in
+catalog_changes() so the version moves once, not once per row.
+"""
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from .metrics import record_cache
+from .models import CatalogVersion, Course, ElectiveType
+
+COURSE_FIELDS = [
+    'id', 'code', 'name', 'credits', 'level', 'prerequisites', 'corequisites',
+    'exclusions', 'mode', 'assessment', 'description', 'study_guide_url',
+    'course_description_url',
+]
+
+CourseRecord = namedtuple('CourseRecord', COURSE_FIELDS + ['elective_type_ids'])
+
+# course_ids are ordered by course code
+ElectiveTypeRecord = namedtuple('ElectiveTypeRecord', ['id', 'name', 'description', 'course_ids'])
+
+Catalog = namedtuple('Catalog', [
+    'version',
+    'courses',          # id -> CourseRecord
+    'courses_by_code',  # code -> CourseRecord
+    'elective_types',   # id -> ElectiveTypeRecord, in id order
+])
+
+_catalog = None
+_batch = threading.local()
+
+
+def load_catalog(version):
+    """Read the catalog from the database without building model instances."""
+    links = Course.elective_types.through.objects.values_list('course_id', 'electivetype_id')
+    type_ids_by_course = {}
+    for course_id, elective_type_id in links:
+        type_ids_by_course.setdefault(course_id, []).append(elective_type_id)
+
+    courses = {}
+    course_ids_by_type = {}
+    for row in Course.objects.order_by('code').values_list(*COURSE_FIELDS):
+        type_ids = tuple(sorted(type_ids_by_course.get(row[0], ())))
+        course = CourseRecord(*row, type_ids)
+        courses[course.id] = course
+        for elective_type_id in type_ids:
+            course_ids_by_type.setdefault(elective_type_id, []).append(course.id)
+
+    elective_types = {
+        pk: ElectiveTypeRecord(pk, name, description, tuple(course_ids_by_type.get(pk, ())))
+        for pk, name, description in ElectiveType.objects.order_by('id').values_list('id', 'name', 'description')
+    }
+
+    return Catalog(
+        version=version,
+        courses=courses,
+        courses_by_code={course.code: course for course in courses.values()},
+        elective_types=elective_types,
+    )
+
+
+def get_catalog():
+    """The current catalog, reloaded if CatalogVersion has moved on."""
+    global _catalog
+    version = CatalogVersion.current()
+    hit = _catalog is not None and _catalog.version == version
+    record_cache('catalog', hit)
+    if not hit:
+        _catalog = load_catalog(version)
+    return _catalog
+
+
+def note_catalog_change():
+    """Record a change in the enclosing catalog_changes() block; False outside one"""
+    if getattr(_batch, 'active', False):
+        _batch.changed = True
+        return True
+    return False
+
+
+@contextmanager
+def catalog_changes():
+    """
+    Group catalog writes (load_courses, an admin save) so the signals bump
+    CatalogVersion once, on commit, after the block, and only if something
+    changed. Nothing is bumped if the block raises.
+    """
+    if getattr(_batch, 'active', False):
+        yield
+        return
+    _batch.active, _batch.changed = True, False
+    try:
+        yield
+    finally:
+        changed = _batch.changed
+        _batch.active = _batch.changed = False
+    if changed:
+        transaction.on_commit(CatalogVersion.bump)
@@ -0,0 +1,160 @@
+"""
+Admin exports: course point totals and selections as CSV, and a compact
+student x course preference matrix.
+
+For the preference matrix the selections are read in one streaming pass and
+written as integer-coded numpy arrays plus a labels.json sidecar, either as a
+directory of .npy files (np.load(..., mmap_mode='r') works on each) or as a
+single .npz archive:
+
+    student_idx.npy        int32, one entry per selection
+    course_idx.npy         int32, one entry per selection
+    elective_type_idx.npy  int32, one entry per selection
+    points.npy             int8, interest points (0/1/2) per selection
+    matrix.npy             int8 [students x courses], highest points a
+                           student gave the course, -1 if no selection
+    labels.json            student ids, course codes and elective type
+                           names in index order
+"""
+import csv
+import json
+import zipfile
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+from django.db.models import Count, Sum, Case, When, IntegerField
+
+from .models import Course, ElectiveType, StudentSelection
+
+CHUNK_SIZE = 2000
+
+
+def with_point_totals(queryset):
+    """Annotate a Course queryset with _total_points and _selection_count."""
+    return queryset.annotate(
+        _total_points=Sum(
+            Case(
+                When(selections__interest='not_willing', then=0),
+                When(selections__interest='willing', then=1),
+                When(selections__interest='prefer', then=2),
+                default=0,
+                output_field=IntegerField()
+            )
+        ),
+        _selection_count=Count('selections')
+    )
+
+
+def write_courses_with_points_csv(fileobj, queryset):
+    """Write annotated courses (see with_point_totals) sorted by total points."""
+    writer = csv.writer(fileobj)
+    writer.writerow(['Course Code', 'Course Name', 'Credits', 'Level', 'Total Points', 'Total Selections'])
+
+    # Sort by total points (descending)
+    sorted_queryset = sorted(queryset, key=lambda x: x._total_points or 0, reverse=True)
+
+    for course in sorted_queryset:
+        writer.writerow([
+            course.code,
+            course.name,
+            course.credits,
+            course.level,
+            course._total_points or 0,
+            course._selection_count or 0,
+        ])
+
+
+def write_selections_csv(fileobj, queryset, progress=None):
+    """
+    Write student selections as CSV. progress, if given, is called as
+    progress(rows_written) every CHUNK_SIZE rows.
+    """
+    writer = csv.writer(fileobj)
+    writer.writerow(['Student ID', 'Course Code', 'Course Name', 'Elective Type', 'Interest', 'Points', 'Date'])
+
+    rows = queryset.select_related('course', 'elective_type').iterator(chunk_size=CHUNK_SIZE)
+    for i, selection in enumerate(rows, 1):
+        writer.writerow([
+            selection.student_id,
+            selection.course.code,
+            selection.course.name,
+            selection.elective_type.name,
+            selection.get_interest_display(),
+            selection.points,
+            selection.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        ])
+        if progress and i % CHUNK_SIZE == 0:
+            progress(i)
+
+
+def build_preference_matrix(queryset=None, progress=None):
+    """
+    Build the index arrays and labels from a StudentSelection queryset.
+    progress works as in write_selections_csv.
+    """
+    if queryset is None:
+        queryset = StudentSelection.objects.all()
+
+    courses = list(Course.objects.order_by('code').values_list('id', 'code'))
+    course_index = {course_id: i for i, (course_id, _) in enumerate(courses)}
+    elective_types = list(ElectiveType.objects.order_by('id').values_list('id', 'name'))
+    elective_type_index = {et_id: i for i, (et_id, _) in enumerate(elective_types)}
+    interest_points = StudentSelection.INTEREST_POINTS
+
+    student_index = {}
+    student_idx = array('i')
+    course_idx = array('i')
+    elective_type_idx = array('i')
+    points = array('b')
+
+    rows = queryset.order_by('student_id').values_list(
+        'student_id', 'course_id', 'elective_type_id', 'interest'
+    ).iterator(chunk_size=CHUNK_SIZE)
+    for student_id, course_id, elective_type_id, interest in rows:
+        student_idx.append(student_index.setdefault(student_id, len(student_index)))
+        course_idx.append(course_index[course_id])
+        elective_type_idx.append(elective_type_index[elective_type_id])
+        points.append(interest_points.get(interest, 0))
+        if progress and len(points) % CHUNK_SIZE == 0:
+            progress(len(points))
+
+    arrays = {
+        'student_idx': np.frombuffer(student_idx, dtype=np.int32),
+        'course_idx': np.frombuffer(course_idx, dtype=np.int32),
+        'elective_type_idx': np.frombuffer(elective_type_idx, dtype=np.int32),
+        'points': np.frombuffer(points, dtype=np.int8),
+    }
+    matrix = np.full((len(student_index), len(courses)), -1, dtype=np.int8)
+    np.maximum.at(matrix, (arrays['student_idx'], arrays['course_idx']), arrays['points'])
+    arrays['matrix'] = matrix
+
+    labels = {
+        'students': list(student_index),
+        'courses': [code for _, code in courses],
+        'elective_types': [name for _, name in elective_types],
+        'interest_points': interest_points,
+        'missing': -1,
+    }
+    return arrays, labels
+
+
+def write_preference_matrix_dir(path, arrays, labels):
+    """Write one .npy per array plus labels.json into a directory."""
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    for name, values in arrays.items():
+        np.save(path / f'{name}.npy', values)
+    with open(path / 'labels.json', 'w', encoding='utf-8') as f:
+        json.dump(labels, f)
+
+
+def write_preference_matrix_npz(fileobj, arrays, labels):
+    """Write the arrays and labels.json into a single .npz archive."""
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_STORED) as archive:
+        for name, values in arrays.items():
+            # Stream each array into the archive without an in-memory copy
+            with archive.open(f'{name}.npy', 'w', force_zip64=True) as member:
+                np.lib.format.write_array(member, values)
+        archive.writestr('labels.json', json.dumps(labels))
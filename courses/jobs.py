@@ -0,0 +1,151 @@
+"""
+Database-backed background jobs for heavy admin work.
+
+Admin actions call enqueue() and return immediately; the run_jobs management
+command (started next to gunicorn, see gunicorn.conf.py) claims queued jobs
+one at a time and stores each result as a file on the Job row, downloadable
+from the Job admin. Handlers return (filename, File) and write large exports
+to a temporary file rather than memory.
+
+Export jobs describe their rows with a scope rather than a list of every
+primary key: {'scope': 'selected', 'ids': [...]} for rows ticked on one
+changelist page, or {'scope': 'all', 'filters': {...}} for "select all",
+holding the changelist's filter and search parameters.
+"""
+import io
+import logging
+import tempfile
+import time
+import traceback
+
+from django.contrib import admin
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.core.files.base import ContentFile, File
+from django.core.management import call_command
+from django.db import OperationalError
+from django.utils import timezone
+
+from .exports import (
+    build_preference_matrix, with_point_totals, write_courses_with_points_csv,
+    write_preference_matrix_npz, write_selections_csv,
+)
+from .models import Course, Job, StudentSelection
+
+logger = logging.getLogger(__name__)
+
+SAVE_RETRIES = 3
+
+
+def enqueue(kind, **params):
+    return Job.objects.create(kind=kind, params=params)
+
+
+def scoped_queryset(model, params):
+    """Rebuild the rows an export job covers from its scope (see above)."""
+    queryset = model._default_manager.all()
+    if params['scope'] == 'selected':
+        return queryset.filter(pk__in=params['ids'])
+
+    filters = dict(params['filters'])
+    search_term = filters.pop(SEARCH_VAR, '')
+    queryset = queryset.filter(**filters)
+    if search_term:
+        model_admin = admin.site.get_model_admin(model)
+        queryset, may_have_duplicates = model_admin.get_search_results(None, queryset, search_term)
+        if may_have_duplicates:
+            queryset = queryset.distinct()
+    return queryset
+
+
+def _csv_file():
+    return tempfile.NamedTemporaryFile('w+', encoding='utf-8', newline='', suffix='.csv')
+
+
+def export_courses_with_points(job):
+    courses = with_point_totals(scoped_queryset(Course, job.params))
+    output = _csv_file()
+    write_courses_with_points_csv(output, courses)
+    return 'courses_with_points.csv', File(output)
+
+
+def export_selections_csv(job):
+    selections = scoped_queryset(StudentSelection, job.params)
+    job.report_progress(0, selections.count())
+    output = _csv_file()
+    write_selections_csv(output, selections, progress=job.report_progress)
+    return 'student_selections.csv', File(output)
+
+
+def export_preference_matrix(job):
+    selections = scoped_queryset(StudentSelection, job.params)
+    job.report_progress(0, selections.count())
+    arrays, labels = build_preference_matrix(selections, progress=job.report_progress)
+    output = tempfile.NamedTemporaryFile('w+b', suffix='.npz')
+    write_preference_matrix_npz(output, arrays, labels)
+    return 'preference_matrix.npz', File(output)
+
+
+def load_courses(job):
+    # The command raises CommandError on a failed import, failing the job
+    output = io.StringIO()
+    call_command('load_courses', job.params['json_file'], stdout=output, no_color=True)
+    return 'load_courses.log', ContentFile(output.getvalue().encode('utf-8'))
+
+
+HANDLERS = {
+    'export_courses_with_points': export_courses_with_points,
+    'export_selections_csv': export_selections_csv,
+    'export_preference_matrix': export_preference_matrix,
+    'load_courses': load_courses,
+}
+
+
+def claim_next_job():
+    """Mark the oldest queued job as running and return it, or None."""
+    for job in Job.objects.filter(status='queued').order_by('created_at')[:5]:
+        # Another worker may have claimed it since the SELECT
+        claimed = Job.objects.filter(pk=job.pk, status='queued').update(
+            status='running', started_at=timezone.now()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def requeue_jobs(jobs):
+    """Put running jobs back in the queue, e.g. after their runner died."""
+    return jobs.filter(status='running').update(
+        status='queued', started_at=None, progress=0,
+        message='Requeued: the job runner stopped while this job was running.',
+    )
+
+
+def run_job(job):
+    """
+    Run a claimed job and record its outcome. Storing the result file is part
+    of the job, so a disk error fails the job instead of the runner.
+    """
+    try:
+        filename, content = HANDLERS[job.kind](job)
+        with content:
+            job.result.save(f'{job.pk}-{filename}', content, save=False)
+    except Exception:
+        logger.exception('Job %s failed', job.pk)
+        job.status = 'failed'
+        job.message = traceback.format_exc()
+    else:
+        job.status = 'done'
+        job.progress = max(job.progress, job.total)
+    job.finished_at = timezone.now()
+
+    # Retry if the web workers hold the SQLite write lock
+    for attempt in range(SAVE_RETRIES + 1):
+        try:
+            job.save()
+            break
+        except OperationalError as e:
+            if 'locked' not in str(e) or attempt == SAVE_RETRIES:
+                raise
+            time.sleep(attempt + 1)
+    return job
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from courses.exports import (
+    build_preference_matrix, write_preference_matrix_dir, write_preference_matrix_npz,
+)
+
+
+class Command(BaseCommand):
+    help = 'Export student selections as a compact numpy preference matrix'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output',
+            type=str,
+            help='Output directory (one memory-mappable .npy per array), or a .npz file'
+        )
+
+    def handle(self, *args, **options):
+        output = options['output']
+        arrays, labels = build_preference_matrix()
+
+        if output.endswith('.npz'):
+            with open(output, 'wb') as f:
+                write_preference_matrix_npz(f, arrays, labels)
+        else:
+            write_preference_matrix_dir(output, arrays, labels)
+
+        students, courses = arrays['matrix'].shape
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {len(arrays["points"])} selections '
+            f'({students} students x {courses} courses) to {output}'
+        ))
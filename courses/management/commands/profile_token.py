@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from courses.profiling import make_profile_token
+
+
+class Command(BaseCommand):
+    help = 'Print a signed X-Profile header value that turns on request profiling'
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_profile_token())
+        hours = settings.PROFILE_TOKEN_MAX_AGE // 3600
+        self.stderr.write(f'Valid for {hours} hours, e.g. curl -H "X-Profile: <token>" <url>')
@@ -0,0 +1,71 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+
+from courses.jobs import claim_next_job, requeue_jobs, run_job
+from courses.models import Job
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (exports, course imports)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run every queued job, then exit instead of polling'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between checks for new jobs'
+        )
+        parser.add_argument(
+            '--no-recover',
+            action='store_true',
+            help="Don't requeue jobs left running by a runner that died "
+                 "(use when several runners share the database)"
+        )
+
+    def handle(self, *args, **options):
+        if not options['no_recover']:
+            # Only one runner uses the database, so anything still marked
+            # running was interrupted when the previous runner stopped
+            requeued = requeue_jobs(Job.objects.all())
+            if requeued:
+                self.stdout.write(self.style.WARNING(f'Requeued {requeued} interrupted job(s)'))
+
+        self.stdout.write('Waiting for jobs...')
+        while True:
+            try:
+                job = claim_next_job()
+            except DatabaseError:
+                # e.g. the database is locked; keep the runner alive
+                logger.exception('Could not claim a job')
+                time.sleep(options['poll_interval'])
+                continue
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f'Running {job}...')
+            try:
+                run_job(job)
+            except Exception:
+                # The outcome couldn't be recorded (e.g. the database stayed
+                # locked); the job stays running until requeued, and the
+                # runner moves on to the next one
+                logger.exception('Could not record the outcome of job %s', job.pk)
+                self.stdout.write(self.style.ERROR(f'Could not record the outcome of {job}'))
+                continue
+            if job.status == 'done':
+                self.stdout.write(self.style.SUCCESS(f'Finished {job}'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Failed {job}'))
@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand
+
+from courses.warmup import warm_up
+
+IMPORT_SCRIPT = 'import django; django.setup(); import elective_system.wsgi'
+
+
+class Command(BaseCommand):
+    help = 'Report import time (python -X importtime) and worker warm-up time'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=25,
+            help='Number of slowest imports to show'
+        )
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'elective_system.settings')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', IMPORT_SCRIPT],
+            env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            self.stdout.write(self.style.ERROR(result.stderr))
+            return
+
+        imports = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            fields = line[len('import time:'):].split('|')
+            try:
+                self_us, cumulative_us = int(fields[0]), int(fields[1])
+            except ValueError:
+                continue  # header line
+            imports.append((cumulative_us, self_us, fields[2].strip()))
+
+        total_us = sum(self_us for _, self_us, _ in imports)
+        self.stdout.write(f'Cold import of the WSGI application: {total_us / 1000:.1f} ms '
+                          f'across {len(imports)} modules')
+        self.stdout.write(f'{"cumulative ms":>14} {"self ms":>9}  module')
+        for cumulative_us, self_us, module in sorted(imports, reverse=True)[:options['top']]:
+            self.stdout.write(f'{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {module}')
+
+        self.stdout.write('')
+        # Without the WAL switch: it would rewrite the database file from a
+        # manage.py command (gunicorn workers do it in post_worker_init)
+        self.stdout.write('Worker warm-up (without the WAL switch):')
+        for step, seconds in warm_up(wal=False):
+            self.stdout.write(f'{seconds * 1000:>14.1f} ms  {step}')
@@ -0,0 +1,68 @@
+"""
+Prometheus metrics for the elective system.
+
+When PROMETHEUS_MULTIPROC_DIR is set (see gunicorn.conf.py) every gunicorn
+worker writes its samples to mmap'd files in that directory and the /metrics
+view aggregates them, so the numbers cover the whole process pool.
+"""
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY,
+    generate_latest, multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    'electives_request_duration_seconds',
+    'Request latency by URL name',
+    ['url_name', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+DB_QUERIES = Counter(
+    'electives_db_queries_total',
+    'Database queries executed, by URL name',
+    ['url_name'],
+)
+
+DB_QUERY_SECONDS = Counter(
+    'electives_db_query_seconds_total',
+    'Time spent executing database queries, by URL name',
+    ['url_name'],
+)
+
+CACHE_REQUESTS = Counter(
+    'electives_cache_requests_total',
+    'Cache lookups by cache name and result (hit/miss)',
+    ['cache', 'result'],
+)
+
+SUBMISSIONS = Counter(
+    'electives_submissions_total',
+    'Selection forms submitted',
+)
+
+SELECTIONS_SAVED = Counter(
+    'electives_selections_saved_total',
+    'Individual course selections saved',
+)
+
+SQLITE_LOCK_RETRIES = Counter(
+    'electives_sqlite_lock_retries_total',
+    'Transactions retried because the SQLite database was locked',
+)
+
+
+def record_cache(cache, hit):
+    """Count a cache lookup as a hit or a miss."""
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def render_metrics():
+    """Return (payload, content_type) for the current metrics."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,120 @@
+import logging
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.db import connection
+
+from .metrics import DB_QUERIES, DB_QUERY_SECONDS, REQUEST_LATENCY
+from .models import RequestProfile
+from .profiling import Sampler, check_profile_token
+
+logger = logging.getLogger(__name__)
+
+
+def url_name_for(request):
+    """Metric label for a request: the resolved view name, or 'unmatched'."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.view_name:
+        return 'unmatched'
+    return match.view_name
+
+
+class MetricsMiddleware:
+    """Record request latency and DB query counts/time per URL name."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0, 0.0]
+
+        def db_wrapper(execute, sql, params, many, context):
+            start = perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries[0] += 1
+                queries[1] += perf_counter() - start
+
+        start = perf_counter()
+        with connection.execute_wrapper(db_wrapper):
+            response = self.get_response(request)
+        elapsed = perf_counter() - start
+
+        url_name = url_name_for(request)
+        REQUEST_LATENCY.labels(url_name, request.method).observe(elapsed)
+        if queries[0]:
+            DB_QUERIES.labels(url_name).inc(queries[0])
+            DB_QUERY_SECONDS.labels(url_name).inc(queries[1])
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Sample the stacks and SQL of a request and store them as a RequestProfile.
+
+    A request is profiled when a staff user adds ?_profile=1, when it carries
+    a valid signed X-Profile header (see the profile_token command), or, if
+    PROFILE_SLOW_MS is set, when it is still running after that many
+    milliseconds. Removed from the stack entirely unless PROFILING_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_after = settings.PROFILE_SLOW_MS / 1000 if settings.PROFILE_SLOW_MS else None
+        self.sampler = Sampler(settings.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+
+    def requested(self, request):
+        if request.GET.get('_profile') and request.user.is_staff:
+            return True
+        token = request.headers.get('X-Profile')
+        return bool(token) and check_profile_token(token, settings.PROFILE_TOKEN_MAX_AGE)
+
+    def __call__(self, request):
+        if self.requested(request):
+            trigger, sample_after = 'requested', 0.0
+        elif self.slow_after is not None:
+            trigger, sample_after = 'slow', self.slow_after
+        else:
+            return self.get_response(request)
+
+        capture = self.sampler.start(sample_after)
+        try:
+            with connection.execute_wrapper(capture.record_query):
+                response = self.get_response(request)
+        finally:
+            self.sampler.stop(capture)
+        elapsed = perf_counter() - capture.start
+
+        if trigger == 'requested' or elapsed >= self.slow_after:
+            # A profile that can't be stored (locked database, full disk)
+            # must not turn the response into an error
+            try:
+                self.save(request, response, trigger, elapsed, capture)
+            except Exception:
+                logger.exception('Could not save the profile of %s', request.path)
+        return response
+
+    def save(self, request, response, trigger, elapsed, capture):
+        profile = RequestProfile(
+            path=request.get_full_path()[:500],
+            view_name=url_name_for(request)[:200],
+            method=request.method,
+            status_code=response.status_code,
+            trigger=trigger,
+            duration_ms=elapsed * 1000,
+            sample_count=sum(capture.stacks.values()),
+            query_count=len(capture.queries),
+            query_ms=sum(q['duration_ms'] for q in capture.queries),
+            queries=capture.queries,
+        )
+        profile.stacks.save(f'{profile.view_name}.collapsed', ContentFile(capture.collapsed()), save=False)
+        try:
+            profile.save()
+        except Exception:
+            profile.stacks.delete(save=False)
+            raise
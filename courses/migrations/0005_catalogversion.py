@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:06
+
+from django.db import migrations, models
+
+
+def create_catalog_version(apps, schema_editor):
+    # The single row CatalogVersion.bump() updates, so bumps never race to create it
+    CatalogVersion = apps.get_model('courses', 'CatalogVersion')
+    CatalogVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_requestprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_catalog_version, migrations.RunPython.noop),
+    ]
@@ -83,3 +83,97 @@ class StudentSelection(models.Model):
         ordering = ['-created_at']
         verbose_name = "Student Selection"
         verbose_name_plural = "Student Selections"
+
+
+class Job(models.Model):
+    """Heavy admin work queued for the run_jobs worker (see courses/jobs.py)"""
+    KIND_CHOICES = [
+        ('export_courses_with_points', 'Export courses with points'),
+        ('export_selections_csv', 'Export selections as CSV'),
+        ('export_preference_matrix', 'Export preference matrix'),
+        ('load_courses', 'Load courses from JSON'),
+    ]
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    message = models.TextField(blank=True)
+    result = models.FileField(upload_to='jobs/', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.status})"
+
+    def report_progress(self, progress, total=None):
+        """Save progress without touching the rest of the row"""
+        self.progress = progress
+        fields = {'progress': progress}
+        if total is not None:
+            self.total = fields['total'] = total
+        Job.objects.filter(pk=self.pk).update(**fields)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+        verbose_name = "Job"
+        verbose_name_plural = "Jobs"
+
+
+class RequestProfile(models.Model):
+    """Stack samples and SQL timeline captured by ProfilingMiddleware"""
+    TRIGGER_CHOICES = [
+        ('requested', 'Requested'),
+        ('slow', 'Slow request'),
+    ]
+
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200)
+    method = models.CharField(max_length=10)
+    status_code = models.PositiveSmallIntegerField()
+    trigger = models.CharField(max_length=20, choices=TRIGGER_CHOICES)
+    duration_ms = models.FloatField()
+    sample_count = models.PositiveIntegerField()
+    query_count = models.PositiveIntegerField()
+    query_ms = models.FloatField()
+    stacks = models.FileField(upload_to='profiles/')
+    queries = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Request Profile"
+        verbose_name_plural = "Request Profiles"
+
+
+class CatalogVersion(models.Model):
+    """
+    Single-row stamp bumped whenever a Course or ElectiveType changes, so each
+    worker knows when to reload its in-memory catalog (see courses/catalog.py)
+    """
+    version = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Catalog version {self.version}"
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        # The row is created by migration 0005
+        cls.objects.filter(pk=1).update(version=models.F('version') + 1)
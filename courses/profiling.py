@@ -0,0 +1,111 @@
+"""
+On-demand stack-sampling profiler for slow requests.
+
+One daemon thread per process samples the Python stacks of requests that are
+being profiled (see ProfilingMiddleware) and counts them as collapsed stacks,
+the "frame;frame;frame count" format read by flamegraph.pl and speedscope.
+Requests that are not being profiled are never sampled.
+"""
+import os
+import sys
+import threading
+from collections import Counter
+from time import perf_counter, sleep
+
+from django.core import signing
+
+SIGNING_SALT = 'courses.profiling'
+
+
+def make_profile_token():
+    """Signed value for the X-Profile header that turns profiling on"""
+    return signing.dumps('profile', salt=SIGNING_SALT)
+
+
+def check_profile_token(token, max_age):
+    try:
+        return signing.loads(token, salt=SIGNING_SALT, max_age=max_age) == 'profile'
+    except signing.BadSignature:
+        return False
+
+
+class Capture:
+    """Stack samples and SQL timeline for one request"""
+
+    def __init__(self, thread_id, sample_after):
+        self.thread_id = thread_id
+        self.start = perf_counter()
+        self.sample_after = self.start + sample_after
+        self.stacks = Counter()
+        self.queries = []
+
+    def record_query(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = perf_counter()
+            self.queries.append({
+                'start_ms': round((start - self.start) * 1000, 3),
+                'duration_ms': round((end - start) * 1000, 3),
+                'sql': sql,
+            })
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        name = getattr(code, 'co_qualname', code.co_name)
+        names.append(f'{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self.captures = {}
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self, sample_after=0.0):
+        """Begin profiling the current thread, sampling after sample_after seconds"""
+        capture = Capture(threading.get_ident(), sample_after)
+        with self.lock:
+            self.captures[capture.thread_id] = capture
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='profiling-sampler', daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+        return capture
+
+    def stop(self, capture):
+        """Stop profiling; once this returns the sampler no longer touches capture"""
+        with self.lock:
+            self.captures.pop(capture.thread_id, None)
+
+    def run(self):
+        while True:
+            self.wakeup.clear()
+            if not self.captures:
+                self.wakeup.wait()
+            sleep(self.interval)
+
+            # Sample under the lock so stop() waits for an in-flight sample,
+            # and the request thread can read capture.stacks safely after it
+            with self.lock:
+                now = perf_counter()
+                due = [c for c in self.captures.values() if now >= c.sample_after]
+                if not due:
+                    continue
+                frames = sys._current_frames()
+                for capture in due:
+                    frame = frames.get(capture.thread_id)
+                    if frame is not None:
+                        capture.stacks[_collapse(frame)] += 1
+                del frames
@@ -0,0 +1,34 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import note_catalog_change
+from .models import CatalogVersion, Course, ElectiveType, StudentSelection
+from .summary import invalidate_student_summary
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=ElectiveType)
+@receiver(post_delete, sender=ElectiveType)
+@receiver(m2m_changed, sender=Course.elective_types.through)
+def bump_catalog_version(sender, **kwargs):
+    """
+    Tell every worker to reload its catalog snapshot once the change commits.
+    Inside catalog_changes() the block bumps once at the end instead.
+    """
+    if not kwargs.get('action', 'post_').startswith('post_'):
+        return
+    if not note_catalog_change():
+        transaction.on_commit(CatalogVersion.bump)
+
+
+# No post_delete receiver: it would turn off Django's fast delete for the
+# cascade from Course, loading every selection row. Deletes are covered by
+# the catalog version in the summary entries and by explicit invalidation
+# (see courses/summary.py).
+@receiver(post_save, sender=StudentSelection)
+def invalidate_selection_summary(sender, instance, **kwargs):
+    """Drop the student's cached summary once the change is committed"""
+    student_id = instance.student_id
+    transaction.on_commit(lambda: invalidate_student_summary(student_id))
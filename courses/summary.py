@@ -0,0 +1,98 @@
+"""
+Per-student summary of selections across all elective types.
+
+The student's raw selections are fetched in one query (served by the
+student_id-first unique index) and cached per student. Writes invalidate the
+entry: submit_selection and the StudentSelection admin explicitly, other
+single-row saves through a post_save signal (courses/signals.py). Entries are
+also tagged with the catalog version, so deleting a course or elective type
+(which cascades to selections) or reloading the catalog invalidates them all
+at once, without a per-row delete signal on the cascade. Course and elective
+type details are joined from the catalog snapshot at render time.
+"""
+import hashlib
+
+from django.core.cache import cache
+
+from .metrics import record_cache
+from .models import StudentSelection
+
+# Bounds how long a bulk delete outside the admin (e.g. from a shell) can go unseen
+SUMMARY_TIMEOUT = 60 * 10
+
+
+def _cache_key(student_id):
+    return 'student-summary:' + hashlib.sha1(student_id.encode('utf-8')).hexdigest()
+
+
+def student_selections(student_id, catalog_version):
+    """
+    Map elective type id -> {course id: interest}, from the cache if it was
+    stored under the same catalog version
+    """
+    key = _cache_key(student_id)
+    cached = cache.get(key)
+    hit = cached is not None and cached[0] == catalog_version
+    record_cache('student_summary', hit)
+    if hit:
+        return cached[1]
+
+    selections = {}
+    rows = StudentSelection.objects.filter(student_id=student_id).order_by().values_list(
+        'elective_type_id', 'course_id', 'interest'
+    )
+    for elective_type_id, course_id, interest in rows:
+        selections.setdefault(elective_type_id, {})[course_id] = interest
+    cache.set(key, (catalog_version, selections), SUMMARY_TIMEOUT)
+    return selections
+
+
+def invalidate_student_summary(student_id):
+    cache.delete(_cache_key(student_id))
+
+
+def invalidate_student_summaries(student_ids):
+    cache.delete_many([_cache_key(student_id) for student_id in student_ids])
+
+
+def student_summary(student_id, catalog):
+    """
+    One entry per elective type with the student's selections, their point
+    total and a completion status ('not_started', 'in_progress', 'complete'),
+    joined with the request's catalog snapshot.
+    """
+    selections = student_selections(student_id, catalog.version)
+    labels = dict(StudentSelection.INTEREST_CHOICES)
+    points = StudentSelection.INTEREST_POINTS
+
+    summary = []
+    for elective_type in catalog.elective_types.values():
+        chosen = selections.get(elective_type.id, {})
+        entries = [
+            {
+                'course': catalog.courses[course_id],
+                'interest': labels.get(interest, interest),
+                'points': points.get(interest, 0),
+            }
+            for course_id, interest in chosen.items()
+            if course_id in catalog.courses
+        ]
+        entries.sort(key=lambda entry: (-entry['points'], entry['course'].code))
+
+        course_count = len(elective_type.course_ids)
+        if not entries:
+            status = 'not_started'
+        elif len(entries) >= course_count:
+            status = 'complete'
+        else:
+            status = 'in_progress'
+
+        summary.append({
+            'elective_type': elective_type,
+            'selections': entries,
+            'selected_count': len(entries),
+            'course_count': course_count,
+            'total_points': sum(entry['points'] for entry in entries),
+            'status': status,
+        })
+    return summary
@@ -1,3 +1,693 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+from time import perf_counter, sleep
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from prometheus_client import REGISTRY
+
+from . import catalog, views
+from .catalog import catalog_changes, get_catalog
+from .jobs import claim_next_job, enqueue, requeue_jobs, run_job, scoped_queryset
+from .models import CatalogVersion, Course, ElectiveType, Job, RequestProfile, StudentSelection
+from .profiling import Sampler, make_profile_token
+from .summary import student_selections
+from .warmup import warm_up
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+class CatalogResetMixin:
+    """
+    Start each test from a fresh catalog snapshot: TestCase never commits, so
+    the on-commit version bump that would normally reload it never runs.
+    """
+
+    def setUp(self):
+        super().setUp()
+        catalog._catalog = None
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class JobTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.elective_type = ElectiveType.objects.create(name='Any Course', description='')
+        cls.other_type = ElectiveType.objects.create(name='Any 300-level Course', description='')
+        cls.course = Course.objects.create(
+            code='ST3188', name='Statistical Methods', credits=30, level=300,
+            mode='LT', assessment='Exam', description='',
+        )
+        for i in range(3):
+            StudentSelection.objects.create(
+                student_id=f'S{i}', course=cls.course, elective_type=cls.elective_type, interest='prefer'
+            )
+        StudentSelection.objects.create(
+            student_id='S9', course=cls.course, elective_type=cls.other_type, interest='willing'
+        )
+
+    def test_claim_next_job_takes_oldest_queued_job_once(self):
+        first = enqueue('export_selections_csv', scope='all', filters={})
+        second = enqueue('export_selections_csv', scope='all', filters={})
+
+        claimed = claim_next_job()
+        self.assertEqual(claimed.pk, first.pk)
+        self.assertEqual(claimed.status, 'running')
+        self.assertIsNotNone(claimed.started_at)
+        self.assertEqual(claim_next_job().pk, second.pk)
+        self.assertIsNone(claim_next_job())
+
+    def test_claim_next_job_skips_job_claimed_by_another_runner(self):
+        job = enqueue('export_selections_csv', scope='all', filters={})
+        # Another runner wins the conditional update first
+        Job.objects.filter(pk=job.pk).update(status='running')
+        self.assertIsNone(claim_next_job())
+
+    def test_run_job_stores_result(self):
+        enqueue('export_selections_csv', scope='all', filters={'elective_type__id__exact': str(self.elective_type.pk)})
+        job = run_job(claim_next_job())
+
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.total, 3)
+        self.assertIsNotNone(job.finished_at)
+        with job.result.open('r') as f:
+            rows = f.read().splitlines()
+        self.assertEqual(rows[0].split(',')[0], 'Student ID')
+        self.assertEqual(len(rows), 4)
+
+    def test_run_job_records_failure(self):
+        enqueue('export_selections_csv', scope='all', filters={'no_such_field': '1'})
+        with self.assertLogs('courses.jobs', 'ERROR'):
+            job = run_job(claim_next_job())
+
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('FieldError', job.message)
+        self.assertFalse(job.result)
+
+    def test_failed_course_import_fails_the_job(self):
+        enqueue('load_courses', json_file='/nonexistent.json')
+        with self.assertLogs('courses.jobs', 'ERROR'):
+            job = run_job(claim_next_job())
+
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('File not found: /nonexistent.json', job.message)
+
+    def test_result_storage_error_fails_the_job(self):
+        enqueue('export_preference_matrix', scope='all', filters={})
+        with mock.patch('django.core.files.storage.FileSystemStorage.save',
+                        side_effect=OSError('No space left on device')), \
+                self.assertLogs('courses.jobs', 'ERROR'):
+            job = run_job(claim_next_job())
+
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'failed')
+        self.assertIn('No space left on device', job.message)
+
+    def test_runner_survives_a_job_whose_outcome_cannot_be_saved(self):
+        first = enqueue('export_selections_csv', scope='all', filters={})
+        second = enqueue('export_selections_csv', scope='all', filters={})
+
+        def locked_once(job):
+            if job.pk == first.pk:
+                raise OperationalError('database is locked')
+            return run_job(job)
+
+        with mock.patch('courses.management.commands.run_jobs.run_job', side_effect=locked_once), \
+                self.assertLogs('courses.management.commands.run_jobs', 'ERROR'):
+            call_command('run_jobs', once=True, no_recover=True, stdout=mock.Mock())
+
+        self.assertEqual(Job.objects.get(pk=first.pk).status, 'running')
+        self.assertEqual(Job.objects.get(pk=second.pk).status, 'done')
+
+    def test_requeue_jobs_only_touches_running_jobs(self):
+        running = enqueue('load_courses', json_file='courses.json')
+        claim_next_job()
+        done = Job.objects.create(kind='load_courses', status='done')
+
+        self.assertEqual(requeue_jobs(Job.objects.all()), 1)
+        running.refresh_from_db()
+        done.refresh_from_db()
+        self.assertEqual(running.status, 'queued')
+        self.assertIsNone(running.started_at)
+        self.assertEqual(done.status, 'done')
+        self.assertEqual(claim_next_job().pk, running.pk)
+
+    def test_scoped_queryset(self):
+        selected = StudentSelection.objects.filter(student_id='S0').values_list('pk', flat=True)
+        self.assertEqual(
+            list(scoped_queryset(StudentSelection, {'scope': 'selected', 'ids': list(selected)})),
+            list(StudentSelection.objects.filter(student_id='S0')),
+        )
+        searched = scoped_queryset(StudentSelection, {'scope': 'all', 'filters': {'q': 'S9'}})
+        self.assertEqual([s.student_id for s in searched], ['S9'])
+
+    def test_select_all_action_stores_filters_not_ids(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        response = self.client.post(
+            '/admin/courses/studentselection/?interest__exact=prefer&p=1',
+            {
+                'action': 'export_as_csv',
+                'select_across': '1',
+                '_selected_action': [StudentSelection.objects.first().pk],
+            },
+        )
+
+        self.assertEqual(response.status_code, 302)
+        job = Job.objects.get()
+        self.assertEqual(job.params, {'scope': 'all', 'filters': {'interest__exact': 'prefer'}})
+
+
+class SamplerTests(SimpleTestCase):
+
+    def test_stop_ends_sampling(self):
+        sampler = Sampler(interval=0.001)
+        capture = sampler.start()
+        deadline = perf_counter() + 5
+        while not capture.stacks and perf_counter() < deadline:
+            sum(range(1000))
+        sampler.stop(capture)
+        stacks = dict(capture.stacks)
+
+        sleep(0.05)
+        self.assertTrue(stacks)
+        self.assertEqual(dict(capture.stacks), stacks)
+        self.assertIn('test_stop_ends_sampling', capture.collapsed())
+
+
+class CatalogVersionTests(CatalogResetMixin, TestCase):
+
+    def test_load_courses_bumps_version_once(self):
+        json_file = Path(__file__).resolve().parent.parent / 'courses_data.json'
+        before = CatalogVersion.current()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            call_command('load_courses', str(json_file), stdout=mock.Mock())
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(CatalogVersion.current(), before + 1)
+
+    def test_failed_load_does_not_bump(self):
+        before = CatalogVersion.current()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks, self.assertRaises(RuntimeError):
+            with transaction.atomic(), catalog_changes():
+                ElectiveType.objects.create(name='Discarded', description='')
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(CatalogVersion.current(), before)
+
+    def test_version_row_is_created_by_migration(self):
+        self.assertTrue(CatalogVersion.objects.filter(pk=1).exists())
+
+    def test_admin_save_bumps_version_once(self):
+        elective_type = ElectiveType.objects.create(name='Any Course', description='')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        before = CatalogVersion.current()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(reverse('admin:courses_course_add'), {
+                'code': 'ST3188', 'name': 'Statistical Methods', 'credits': 30, 'level': 300,
+                'mode': 'LT', 'assessment': 'Exam', 'description': 'Survey sampling',
+                'elective_types': [elective_type.pk],
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(CatalogVersion.current(), before + 1)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.get(reverse('admin:courses_course_changelist'))
+        self.assertEqual(callbacks, [])
+
+    def test_views_read_catalog_once_per_request(self):
+        elective_type = ElectiveType.objects.create(name='Any Course', description='')
+        session = self.client.session
+        session['student_id'] = 'S1'
+        session.save()
+
+        urls = [
+            reverse('home'),
+            reverse('browse_courses', args=[elective_type.pk]),
+            reverse('select_courses', args=[elective_type.pk]),
+            reverse('student_dashboard'),
+        ]
+        for url in urls:
+            with self.subTest(url=url), mock.patch.object(views, 'get_catalog', wraps=get_catalog) as spy:
+                self.assertEqual(self.client.get(url).status_code, 200)
+                self.assertEqual(spy.call_count, 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StudentSummaryTests(CatalogResetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.elective_type = ElectiveType.objects.create(name='Any Course', description='')
+        cls.course = Course.objects.create(
+            code='ST3188', name='Statistical Methods', credits=30, level=300,
+            mode='LT', assessment='Exam', description='',
+        )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def selections(self, student_id='S1'):
+        return student_selections(student_id, CatalogVersion.current())
+
+    def select(self, interest, student_id='S1'):
+        return StudentSelection.objects.create(
+            student_id=student_id, course=self.course, elective_type=self.elective_type, interest=interest
+        )
+
+    def test_saves_invalidate_cached_summary(self):
+        self.assertEqual(self.selections(), {})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            selection = self.select('willing')
+        self.assertEqual(self.selections(), {self.elective_type.pk: {self.course.pk: 'willing'}})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            selection.interest = 'prefer'
+            selection.save()
+        self.assertEqual(self.selections(), {self.elective_type.pk: {self.course.pk: 'prefer'}})
+
+    def test_submit_invalidates_cached_summary(self):
+        self.course.elective_types.add(self.elective_type)
+        session = self.client.session
+        session['student_id'] = 'S1'
+        session.save()
+        self.assertEqual(self.selections(), {})
+
+        self.client.post(reverse('submit_selection', args=[self.elective_type.pk]),
+                         {f'course_{self.course.pk}': 'willing'})
+        self.assertEqual(self.selections(), {self.elective_type.pk: {self.course.pk: 'willing'}})
+
+    def test_admin_delete_invalidates_cached_summary(self):
+        selection = self.select('willing')
+        other = self.select('prefer', student_id='S2')
+        self.assertTrue(self.selections('S1'))
+        self.assertTrue(self.selections('S2'))
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.client.post(reverse('admin:courses_studentselection_changelist'), {
+            'action': 'delete_selected', '_selected_action': [selection.pk, other.pk], 'post': 'yes',
+        })
+        self.assertEqual(self.selections('S1'), {})
+        self.assertEqual(self.selections('S2'), {})
+
+    def test_course_delete_invalidates_by_catalog_version_without_loading_selections(self):
+        self.select('willing')
+        self.assertTrue(self.selections())
+
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            self.course.delete()
+        # The cascade is a fast DELETE, not a SELECT of every selection row
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT "courses_studentselection"')])
+        self.assertEqual(self.selections(), {})
+
+
+def sample_value(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+class MetricsTests(CatalogResetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.elective_type = ElectiveType.objects.create(name='Any Course', description='')
+        cls.course = Course.objects.create(
+            code='ST3188', name='Statistical Methods', credits=30, level=300,
+            mode='LT', assessment='Exam', description='',
+        )
+        cls.course.elective_types.add(cls.elective_type)
+
+    def test_middleware_records_latency_and_queries_by_url_name(self):
+        labels = {'url_name': 'browse_courses', 'method': 'GET'}
+        requests = sample_value('electives_request_duration_seconds_count', labels)
+        queries = sample_value('electives_db_queries_total', {'url_name': 'browse_courses'})
+
+        self.client.get(reverse('browse_courses', args=[self.elective_type.pk]))
+
+        self.assertEqual(sample_value('electives_request_duration_seconds_count', labels), requests + 1)
+        self.assertGreater(sample_value('electives_db_queries_total', {'url_name': 'browse_courses'}), queries)
+
+    def test_unmatched_urls_share_one_label(self):
+        labels = {'url_name': 'unmatched', 'method': 'GET'}
+        before = sample_value('electives_request_duration_seconds_count', labels)
+        self.client.get('/no-such-page/')
+        self.assertEqual(sample_value('electives_request_duration_seconds_count', labels), before + 1)
+
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_metrics_denied_without_token_when_not_debug(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    @override_settings(METRICS_TOKEN='', DEBUG=True)
+    def test_metrics_open_without_token_in_debug(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'electives_request_duration_seconds', response.content)
+
+    @override_settings(METRICS_TOKEN='secret', DEBUG=True)
+    def test_metrics_token_required_when_set(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer secret'}).status_code, 200)
+
+    def test_submit_retries_locked_database(self):
+        session = self.client.session
+        session['student_id'] = 'S1'
+        session.save()
+        save_selections = views._save_selections
+        calls = []
+
+        def locked_once(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return save_selections(*args)
+
+        retries = sample_value('electives_sqlite_lock_retries_total')
+        with mock.patch.object(views, '_save_selections', side_effect=locked_once), \
+                mock.patch.object(views.time, 'sleep'):
+            response = self.client.post(
+                reverse('submit_selection', args=[self.elective_type.pk]),
+                {f'course_{self.course.pk}': 'prefer'},
+            )
+
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(sample_value('electives_sqlite_lock_retries_total'), retries + 1)
+        self.assertEqual(StudentSelection.objects.get(student_id='S1').interest, 'prefer')
+
+
+class WarmUpTests(TestCase):
+
+    def test_wal_switch_only_when_asked(self):
+        with CaptureQueriesContext(connection) as queries:
+            steps = [step for step, _ in warm_up(wal=False)]
+        self.assertNotIn('enable WAL', steps)
+        self.assertFalse([q for q in queries if 'journal_mode' in q['sql']])
+
+        with CaptureQueriesContext(connection) as queries:
+            steps = [step for step, _ in warm_up()]
+        self.assertIn('enable WAL', steps)
+        self.assertTrue([q for q in queries if 'journal_mode' in q['sql']])
+
+
+class PreferenceMatrixTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.any_course = ElectiveType.objects.create(name='Any Course', description='')
+        cls.level_300 = ElectiveType.objects.create(name='Any 300-level Course', description='')
+        cls.courses = [
+            Course.objects.create(
+                code=code, name=code, credits=30, level=300, mode='LT', assessment='Exam', description='',
+            )
+            for code in ['MA3110', 'ST3188', 'EC3099']
+        ]
+        ma3110, st3188, ec3099 = cls.courses
+        # S2 rates ST3188 under both elective types; the matrix keeps the higher
+        cls.selections = [
+            ('S2', st3188, cls.any_course, 'willing'),
+            ('S2', st3188, cls.level_300, 'prefer'),
+            ('S2', ec3099, cls.any_course, 'not_willing'),
+            ('S1', ma3110, cls.level_300, 'willing'),
+        ]
+        for student_id, course, elective_type, interest in cls.selections:
+            StudentSelection.objects.create(
+                student_id=student_id, course=course, elective_type=elective_type, interest=interest
+            )
+
+    def setUp(self):
+        self.output = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.output, ignore_errors=True)
+
+    def assert_matrix_files(self, arrays, labels):
+        self.assertEqual(labels['students'], ['S1', 'S2'])
+        self.assertEqual(labels['courses'], ['EC3099', 'MA3110', 'ST3188'])
+        self.assertEqual(labels['elective_types'], ['Any Course', 'Any 300-level Course'])
+        self.assertEqual(labels['missing'], -1)
+
+        self.assertEqual(arrays['student_idx'].dtype, np.int32)
+        self.assertEqual(arrays['points'].dtype, np.int8)
+        self.assertEqual(arrays['matrix'].dtype, np.int8)
+
+        # The index arrays decode back to the stored selections
+        decoded = sorted(
+            (labels['students'][s], labels['courses'][c], labels['elective_types'][e], int(p))
+            for s, c, e, p in zip(arrays['student_idx'], arrays['course_idx'],
+                                  arrays['elective_type_idx'], arrays['points'])
+        )
+        points = StudentSelection.INTEREST_POINTS
+        expected = sorted(
+            (student_id, course.code, elective_type.name, points[interest])
+            for student_id, course, elective_type, interest in self.selections
+        )
+        self.assertEqual(decoded, expected)
+
+        np.testing.assert_array_equal(arrays['matrix'], [
+            # EC3099 MA3110 ST3188
+            [-1, 1, -1],  # S1
+            [0, -1, 2],   # S2: ST3188 rated 1 and 2 under two elective types
+        ])
+
+    def test_directory_round_trip_with_mmap(self):
+        call_command('export_preference_matrix', str(self.output / 'matrix'), stdout=mock.Mock())
+
+        directory = self.output / 'matrix'
+        arrays = {
+            name: np.load(directory / f'{name}.npy', mmap_mode='r')
+            for name in ['student_idx', 'course_idx', 'elective_type_idx', 'points', 'matrix']
+        }
+        self.assertIsInstance(arrays['matrix'], np.memmap)
+        labels = json.loads((directory / 'labels.json').read_text(encoding='utf-8'))
+        self.assert_matrix_files(arrays, labels)
+
+    def test_npz_round_trip(self):
+        path = self.output / 'matrix.npz'
+        call_command('export_preference_matrix', str(path), stdout=mock.Mock())
+
+        with np.load(path) as archive:
+            arrays = {name: archive[name] for name in archive.files if name != 'labels.json'}
+        with zipfile.ZipFile(path) as archive:
+            labels = json.loads(archive.read('labels.json'))
+        self.assert_matrix_files(arrays, labels)
+
+
+@mock.patch.object(views, 'COURSE_PAGE_SIZE', 3)
+class CoursePagingTests(CatalogResetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.elective_type = ElectiveType.objects.create(name='Any Course', description='')
+        cls.courses = []
+        for i in range(8):
+            course = Course.objects.create(
+                code=f'C{i:02}', name=f'Course {i}', credits=30, level=300,
+                mode='LT', assessment='Exam', description='',
+            )
+            course.elective_types.add(cls.elective_type)
+            cls.courses.append(course)
+        # S1 prefers the first four courses, so they lead the first ranking
+        for course in cls.courses[:4]:
+            cls.select('S1', course, 'prefer')
+        cls.select('S2', cls.courses[0], 'willing')
+
+    @classmethod
+    def select(cls, student_id, course, interest):
+        return StudentSelection.objects.create(
+            student_id=student_id, course=course, elective_type=cls.elective_type, interest=interest
+        )
+
+    def setUp(self):
+        super().setUp()
+        session = self.client.session
+        session['student_id'] = 'S1'
+        session.save()
+
+    def url(self, name, query=''):
+        url = reverse(name, args=[self.elective_type.pk])
+        return f'{url}?{query}' if query else url
+
+    def walk(self, first_url, next_url, between_pages=None):
+        """Course codes on every page, following next_query until the last page"""
+        codes = []
+        response = self.client.get(first_url)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            codes += [course.code for course, _ in response.context['courses']]
+            query = response.context['next_query']
+            if not query:
+                return codes
+            if between_pages:
+                between_pages()
+                between_pages = None
+            response = self.client.get(next_url(query))
+
+    def assert_each_course_once(self, codes):
+        self.assertEqual(sorted(codes), [course.code for course in self.courses])
+
+    def test_pages_rank_by_points_then_code(self):
+        codes = self.walk(self.url('browse_courses'), lambda query: self.url('browse_courses', query))
+        self.assertEqual(codes, ['C00', 'C01', 'C02', 'C03', 'C04', 'C05', 'C06', 'C07'])
+
+    def test_lazy_pages_show_each_course_once_while_points_change(self):
+        def change_points():
+            # C07 rises past the cursor; C00's rows are rewritten, so its
+            # as_of-filtered total drops below the cursor
+            for student_id in ['S3', 'S4', 'S5']:
+                self.select(student_id, self.courses[7], 'prefer')
+            StudentSelection.objects.filter(course=self.courses[0]).delete()
+            self.select('S1', self.courses[0], 'prefer')
+
+        codes = self.walk(
+            self.url('browse_courses'),
+            lambda query: self.url('course_cards', 'mode=browse&' + query),
+            between_pages=change_points,
+        )
+        self.assert_each_course_once(codes)
+
+    def test_save_and_show_more_without_javascript_shows_each_course_once(self):
+        # "Save and show more courses" re-saves the page's ratings (new rows,
+        # newer than as_of) and redirects to the next full page
+        codes = []
+        response = self.client.get(self.url('select_courses'))
+        while True:
+            page = response.context['courses']
+            codes += [course.code for course, _ in page]
+            query = response.context['next_query']
+            if not query:
+                break
+            data = {f'course_{course.id}': 'prefer' for course, _ in page}
+            data['next'] = self.url('select_courses', query)
+            response = self.client.post(self.url('submit_selection'), data, follow=True)
+        self.assert_each_course_once(codes)
+        # Every page but the last (two cards) was saved
+        self.assertEqual(StudentSelection.objects.filter(student_id='S1', interest='prefer').count(), 6)
+
+    def test_malformed_cursor_is_rejected(self):
+        as_of = '2026-01-01T00:00:00%2B00:00'
+        for query in [
+            '',
+            f'after_points=2&as_of={as_of}',
+            f'after_points=x&after_code=C01&as_of={as_of}',
+            'after_points=2&after_code=C01&as_of=2026-01-01T00:00:00',
+            f'after_points=2&after_code=C01&as_of={as_of}&seen=1,x',
+        ]:
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(self.url('course_cards', query)).status_code, 400)
+
+    def test_select_mode_cards_need_a_student(self):
+        self.client.session.flush()
+        self.client.cookies.clear()
+        query = 'mode=select&after_points=2&after_code=C01&as_of=2026-01-01T00:00:00%2B00:00'
+        self.assertEqual(self.client.get(self.url('course_cards', query)).status_code, 403)
+
+    def test_partial_submit_keeps_ratings_on_unloaded_cards(self):
+        self.client.post(self.url('submit_selection'), {
+            f'course_{self.courses[0].id}': 'not_willing',
+            f'course_{self.courses[5].id}': 'willing',
+        })
+        ratings = dict(StudentSelection.objects.filter(student_id='S1').values_list('course__code', 'interest'))
+        self.assertEqual(ratings, {
+            'C00': 'not_willing', 'C01': 'prefer', 'C02': 'prefer', 'C03': 'prefer', 'C05': 'willing',
+        })
+
+    def test_submit_only_follows_next_on_this_host(self):
+        data = {f'course_{self.courses[0].id}': 'willing'}
+        response = self.client.post(self.url('submit_selection'), {**data, 'next': 'https://evil.example/'})
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+        next_url = self.url('select_courses', 'after_points=2&after_code=C01')
+        response = self.client.post(self.url('submit_selection'), {**data, 'next': next_url})
+        self.assertRedirects(response, next_url, fetch_redirect_response=False)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PROFILING_ENABLED=True, PROFILE_SLOW_MS=0)
+class ProfilingMiddlewareTests(CatalogResetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        cls.student = User.objects.create_user('student', password='password')
+
+    def profiles(self):
+        return list(RequestProfile.objects.values_list('view_name', 'trigger'))
+
+    def slow_home(self):
+        """Make the home view take ~50 ms, long enough to be sampled"""
+        def slow_catalog():
+            sleep(0.05)
+            return get_catalog()
+        return mock.patch.object(views, 'get_catalog', side_effect=slow_catalog)
+
+    def test_staff_can_request_a_profile(self):
+        self.client.force_login(self.staff)
+        with self.slow_home():
+            self.assertEqual(self.client.get(reverse('home'), {'_profile': '1'}).status_code, 200)
+        self.assertEqual(self.profiles(), [('home', 'requested')])
+
+        profile = RequestProfile.objects.get()
+        self.assertGreater(profile.query_count, 0)
+        self.assertGreater(profile.sample_count, 0)
+        with profile.stacks.open('r') as f:
+            self.assertIn('slow_catalog (tests.py', f.read())
+
+    def test_non_staff_cannot_request_a_profile(self):
+        self.client.force_login(self.student)
+        self.client.get(reverse('home'), {'_profile': '1'})
+        self.client.get(reverse('home'))
+        self.assertEqual(self.profiles(), [])
+
+    def test_signed_header_requests_a_profile(self):
+        self.client.get(reverse('home'), headers={'X-Profile': 'forged'})
+        self.assertEqual(self.profiles(), [])
+
+        self.client.get(reverse('home'), headers={'X-Profile': make_profile_token()})
+        self.assertEqual(self.profiles(), [('home', 'requested')])
+
+    def test_slow_requests_are_profiled(self):
+        with override_settings(PROFILE_SLOW_MS=20):
+            client = self.client_class()
+            client.get(reverse('browse_courses', args=[1]))
+            self.assertEqual(self.profiles(), [])
+
+            with self.slow_home():
+                client.get(reverse('home'))
+        self.assertEqual(self.profiles(), [('home', 'slow')])
+        self.assertGreaterEqual(RequestProfile.objects.get().duration_ms, 20)
+
+    def test_failed_profile_save_keeps_the_response(self):
+        self.client.force_login(self.staff)
+        with mock.patch.object(RequestProfile, 'save', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('courses.middleware', 'ERROR'):
+            response = self.client.get(reverse('home'), {'_profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.profiles(), [])
+
+    def test_admin_survives_missing_stacks_file(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('home'), {'_profile': '1'})
+        profile = RequestProfile.objects.get()
+        profile.stacks.storage.delete(profile.stacks.name)
+
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin:courses_requestprofile_change', args=[profile.pk]))
+        self.assertContains(response, 'The stacks file is missing.')
+        response = self.client.get(reverse('admin:courses_requestprofile_stacks', args=[profile.pk]))
+        self.assertEqual(response.status_code, 404)
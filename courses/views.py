@@ -1,33 +1,40 @@
-from django.shortcuts import render, redirect, get_object_or_404
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.shortcuts import render, redirect
 from django.contrib import messages
+from django.db import OperationalError, transaction
 from django.db.models import Sum, Case, When, IntegerField
-from .models import ElectiveType, Course, StudentSelection
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.utils import timezone
+from django.utils.http import url_has_allowed_host_and_scheme
+from .catalog import get_catalog
+from .metrics import SELECTIONS_SAVED, SQLITE_LOCK_RETRIES, SUBMISSIONS, render_metrics
+from .models import StudentSelection
+from .summary import invalidate_student_summary, student_summary
+
+LOCK_RETRIES = 3
+COURSE_PAGE_SIZE = 20
 
 
 def home(request):
     """Home page showing elective types"""
-    elective_types = ElectiveType.objects.all()
+    elective_types = get_catalog().elective_types.values()
     return render(request, 'courses/home.html', {'elective_types': elective_types})
 
 
 def browse_courses(request, elective_type_id):
     """Browse courses for a specific elective type"""
-    elective_type = get_object_or_404(ElectiveType, id=elective_type_id)
-    courses = Course.objects.filter(elective_types=elective_type).annotate(
-        total_points=Sum(
-            Case(
-                When(selections__interest='not_willing', then=0),
-                When(selections__interest='willing', then=1),
-                When(selections__interest='prefer', then=2),
-                default=0,
-                output_field=IntegerField()
-            )
-        )
-    ).order_by('-total_points', 'code')
+    catalog = get_catalog()
+    elective_type = _elective_type_or_404(catalog, elective_type_id)
+    courses, next_cursor = _course_page(catalog, elective_type, _page_cursor(request))
 
     return render(request, 'courses/browse.html', {
         'elective_type': elective_type,
         'courses': courses,
+        'next_query': _cursor_query(next_cursor),
         'mode': 'browse'
     })
 
@@ -38,9 +45,8 @@ def select_elective_type(request):
         student_id = request.POST.get('student_id')
         if student_id:
             request.session['student_id'] = student_id
-            elective_types = ElectiveType.objects.all()
             return render(request, 'courses/select_elective_type.html', {
-                'elective_types': elective_types,
+                'summary': student_summary(student_id, get_catalog()),
                 'student_id': student_id
             })
         else:
@@ -49,6 +55,19 @@ def select_elective_type(request):
     return redirect('home')
 
 
+def student_dashboard(request):
+    """Everything the student has submitted, grouped by elective type"""
+    student_id = request.session.get('student_id')
+    if not student_id:
+        messages.error(request, 'Please enter your student ID first')
+        return redirect('home')
+
+    return render(request, 'courses/student_dashboard.html', {
+        'summary': student_summary(student_id, get_catalog()),
+        'student_id': student_id
+    })
+
+
 def select_courses(request, elective_type_id):
     """Select courses for a specific elective type"""
     student_id = request.session.get('student_id')
@@ -56,34 +75,147 @@ def select_courses(request, elective_type_id):
         messages.error(request, 'Please enter your student ID first')
         return redirect('home')
 
-    elective_type = get_object_or_404(ElectiveType, id=elective_type_id)
-    courses = Course.objects.filter(elective_types=elective_type).annotate(
+    catalog = get_catalog()
+    elective_type = _elective_type_or_404(catalog, elective_type_id)
+    courses, next_cursor = _course_page(catalog, elective_type, _page_cursor(request))
+
+    return render(request, 'courses/select.html', {
+        'elective_type': elective_type,
+        'courses': courses,
+        'next_query': _cursor_query(next_cursor),
+        'student_id': student_id,
+        'selections': _student_selections(student_id, elective_type),
+        'mode': 'select'
+    })
+
+
+def course_cards(request, elective_type_id):
+    """Next page of course cards as partial HTML, for infinite scrolling"""
+    catalog = get_catalog()
+    elective_type = _elective_type_or_404(catalog, elective_type_id)
+    try:
+        cursor = _parse_cursor(request.GET)
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest('after_points, after_code and as_of are required')
+
+    context = {'elective_type': elective_type, 'mode': 'browse'}
+    if request.GET.get('mode') == 'select':
+        student_id = request.session.get('student_id')
+        if not student_id:
+            return HttpResponseForbidden()
+        context.update(mode='select', selections=_student_selections(student_id, elective_type))
+
+    context['courses'], next_cursor = _course_page(catalog, elective_type, cursor)
+    context['next_query'] = _cursor_query(next_cursor)
+    return render(request, 'courses/_course_cards.html', context)
+
+
+def _elective_type_or_404(catalog, elective_type_id):
+    try:
+        return catalog.elective_types[elective_type_id]
+    except KeyError:
+        raise Http404('No elective type matches the given query.')
+
+
+def _parse_cursor(params):
+    """Keyset cursor from query parameters; KeyError/ValueError if malformed"""
+    as_of = datetime.fromisoformat(params['as_of'])
+    if timezone.is_naive(as_of):
+        raise ValueError('as_of must include a timezone')
+    return {
+        'after_points': int(params['after_points']),
+        'after_code': params['after_code'],
+        'as_of': as_of,
+        'seen': [int(course_id) for course_id in params.get('seen', '').split(',') if course_id],
+    }
+
+
+def _page_cursor(request):
+    """Cursor for a full page continued without JavaScript, or None for the first page"""
+    try:
+        return _parse_cursor(request.GET)
+    except (KeyError, ValueError):
+        return None
+
+
+def _cursor_query(cursor):
+    if cursor is None:
+        return ''
+    return urlencode({
+        'after_points': cursor['after_points'],
+        'after_code': cursor['after_code'],
+        'as_of': cursor['as_of'].isoformat(),
+        'seen': ','.join(map(str, cursor['seen'])),
+    })
+
+
+def _course_page(catalog, elective_type, cursor=None):
+    """
+    One page of an elective type's courses ranked by (-total_points, code),
+    starting after the given keyset cursor. Returns ([(course, points), ...],
+    next_cursor), where next_cursor is None on the last page. Courses come
+    from the catalog snapshot; only the point totals are queried.
+
+    The ranking is fixed when the first page loads: later pages only count
+    selection rows not modified since the cursor's as_of, so a course's points
+    can drop between pages but never rise past the cursor unseen. A course
+    whose points dropped (e.g. one the student just re-rated with "Save and
+    show more courses") can sort after the cursor again, so the cursor also
+    carries the ids already shown and those are never sent twice.
+    """
+    selections = StudentSelection.objects.filter(course__elective_types=elective_type.id)
+    if cursor is None:
+        as_of = timezone.now()
+    else:
+        as_of = cursor['as_of']
+        selections = selections.filter(updated_at__lte=as_of)
+    totals = dict(selections.order_by().values_list('course_id').annotate(
         total_points=Sum(
             Case(
-                When(selections__interest='not_willing', then=0),
-                When(selections__interest='willing', then=1),
-                When(selections__interest='prefer', then=2),
+                When(interest='not_willing', then=0),
+                When(interest='willing', then=1),
+                When(interest='prefer', then=2),
                 default=0,
                 output_field=IntegerField()
             )
         )
-    ).order_by('-total_points', 'code')
+    ))
+
+    ranked = sorted(
+        ((catalog.courses[course_id], totals.get(course_id) or 0) for course_id in elective_type.course_ids),
+        key=lambda entry: (-entry[1], entry[0].code)
+    )
 
-    # Get existing selections for this student
+    seen = []
+    if cursor is not None:
+        after = (-cursor['after_points'], cursor['after_code'])
+        seen = cursor['seen']
+        shown = set(seen)
+        ranked = [
+            entry for entry in ranked
+            if (-entry[1], entry[0].code) > after and entry[0].id not in shown
+        ]
+
+    if len(ranked) <= COURSE_PAGE_SIZE:
+        return ranked, None
+    page = ranked[:COURSE_PAGE_SIZE]
+    last_course, last_points = page[-1]
+    return page, {
+        'after_points': last_points,
+        'after_code': last_course.code,
+        'as_of': as_of,
+        'seen': seen + [course.id for course, _ in page],
+    }
+
+
+def _student_selections(student_id, elective_type):
+    """Map course id -> interest for a student's selections in an elective type"""
     existing_selections = StudentSelection.objects.filter(
         student_id=student_id,
-        elective_type=elective_type
+        elective_type_id=elective_type.id
     ).values_list('course_id', 'interest')
 
-    selections_dict = {course_id: interest for course_id, interest in existing_selections}
-
-    return render(request, 'courses/select.html', {
-        'elective_type': elective_type,
-        'courses': courses,
-        'student_id': student_id,
-        'selections': selections_dict,
-        'mode': 'select'
-    })
+    return {course_id: interest for course_id, interest in existing_selections}
 
 
 def submit_selection(request, elective_type_id):
@@ -96,28 +228,75 @@ def submit_selection(request, elective_type_id):
         messages.error(request, 'Session expired. Please enter your student ID again')
         return redirect('home')
 
-    elective_type = get_object_or_404(ElectiveType, id=elective_type_id)
+    elective_type = _elective_type_or_404(get_catalog(), elective_type_id)
+
+    # Replace this student's selections for the elective type in one
+    # transaction, retrying if another worker holds the SQLite write lock
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            with transaction.atomic():
+                selections_made = _save_selections(request.POST, student_id, elective_type)
+            break
+        except OperationalError as e:
+            if 'locked' not in str(e) or attempt == LOCK_RETRIES:
+                raise
+            SQLITE_LOCK_RETRIES.inc()
+            time.sleep(0.05 * (attempt + 1))
+    invalidate_student_summary(student_id)
+
+    SUBMISSIONS.inc()
+    SELECTIONS_SAVED.inc(selections_made)
+    messages.success(request, f'Successfully submitted {selections_made} selections for {elective_type.name}')
+
+    # "Save and show more courses" on a page rendered without JavaScript
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
+    return redirect('home')
+
 
-    # Clear existing selections for this elective type
+def _save_selections(data, student_id, elective_type):
+    """
+    Replace the student's selections for the courses present in the form data.
+    Courses missing from the form (cards that were never loaded on a lazily
+    paginated page) keep their existing selection.
+    """
+    submitted = {}
+    for course_id in elective_type.course_ids:
+        interest = data.get(f'course_{course_id}')
+        if interest in ['willing', 'not_willing', 'prefer']:
+            submitted[course_id] = interest
+
+    # Clear existing selections for the submitted courses
     StudentSelection.objects.filter(
         student_id=student_id,
-        elective_type=elective_type
+        elective_type_id=elective_type.id,
+        course_id__in=list(submitted)
     ).delete()
 
-    # Save new selections
-    courses = Course.objects.filter(elective_types=elective_type)
-    selections_made = 0
+    # Save new selections in one INSERT (bulk_create sends no post_save, so
+    # submit_selection invalidates the student's summary once itself)
+    StudentSelection.objects.bulk_create([
+        StudentSelection(
+            student_id=student_id,
+            course_id=course_id,
+            elective_type_id=elective_type.id,
+            interest=interest
+        )
+        for course_id, interest in submitted.items()
+    ])
 
-    for course in courses:
-        interest = request.POST.get(f'course_{course.id}')
-        if interest in ['willing', 'not_willing', 'prefer']:
-            StudentSelection.objects.create(
-                student_id=student_id,
-                course=course,
-                elective_type=elective_type,
-                interest=interest
-            )
-            selections_made += 1
+    return len(submitted)
 
-    messages.success(request, f'Successfully submitted {selections_made} selections for {elective_type.name}')
-    return redirect('home')
+
+def metrics(request):
+    """Prometheus metrics, aggregated across gunicorn workers"""
+    token = settings.METRICS_TOKEN
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        # Traffic and per-view timings are not public without a token
+        return HttpResponseForbidden()
+    payload, content_type = render_metrics()
+    return HttpResponse(payload, content_type=content_type)
@@ -0,0 +1,85 @@
+"""
+Per-worker warm-up, run from gunicorn's post_worker_init hook so the first
+real request doesn't pay for lazy imports, template compilation and
+database connection setup.
+"""
+import importlib
+import logging
+from pathlib import Path
+from time import perf_counter
+
+from django.db import connection
+from django.template.loader import get_template
+
+logger = logging.getLogger(__name__)
+
+HOT_MODULES = [
+    'csv',
+    'courses.views',
+    'courses.admin',
+    'courses.templatetags.course_filters',
+    'django.contrib.messages.storage.fallback',
+    'django.contrib.sessions.backends.db',
+]
+
+TEMPLATE_DIR = Path(__file__).resolve().parent / 'templates'
+
+
+def import_hot_modules():
+    for name in HOT_MODULES:
+        importlib.import_module(name)
+
+
+def compile_templates():
+    """Load every app template once so the cached loader holds them compiled."""
+    for path in sorted(TEMPLATE_DIR.rglob('*.html')):
+        get_template(path.relative_to(TEMPLATE_DIR).as_posix())
+
+
+def open_database():
+    connection.ensure_connection()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def enable_wal():
+    """
+    Put SQLite in WAL mode so readers don't block the writer. This is stored
+    in the database file, so only gunicorn workers do it, not manage.py.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+
+
+def prime_catalog():
+    """Load this worker's catalog snapshot."""
+    from .catalog import get_catalog
+    get_catalog()
+
+
+STEPS = [
+    ('import hot modules', import_hot_modules),
+    ('compile templates', compile_templates),
+    ('open database', open_database),
+    ('enable WAL', enable_wal),
+    ('prime catalog', prime_catalog),
+]
+
+
+def warm_up(wal=True):
+    """
+    Run all warm-up steps and return a list of (step, seconds). wal=False
+    skips the WAL switch, leaving the database file untouched.
+    """
+    timings = []
+    for name, step in STEPS:
+        if step is enable_wal and not wal:
+            continue
+        start = perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception('Warm-up step %r failed', name)
+        timings.append((name, perf_counter() - start))
+    return timings
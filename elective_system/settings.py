@@ -42,12 +42,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'courses.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'courses.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -79,6 +81,39 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep each worker's connection open between requests instead of
+        # reconnecting (and re-running init_command) every time
+        'CONN_MAX_AGE': None,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # journal_mode=WAL is persistent in the file, so it is switched on
+            # by the gunicorn warm-up (courses/warmup.py), not by every
+            # manage.py command
+            'init_command': 'PRAGMA synchronous=NORMAL',
+            'transaction_mode': 'IMMEDIATE',
+            # Short busy timeout: submit_selection retries a locked write
+            # itself (LOCK_RETRIES), and all attempts together have to finish
+            # well inside gunicorn's 30 s worker timeout
+            'timeout': 5,
+        },
+    }
+}
+
+
+# Cache
+# File-based so every gunicorn worker on the machine shares it (per-student
+# selection summaries are invalidated from whichever worker handles a submit)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR / '.cache'),
+        'OPTIONS': {
+            # One entry per student who has looked at their summary; keep this
+            # above the student body, since past it each set culls a third of
+            # the entries (the default of 300 would hold about 300 students)
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', '20000')),
+        },
     }
 }
 
@@ -122,6 +157,10 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Uploaded and generated files (background job results); served only
+# through the admin, never as public media
+MEDIA_ROOT = Path(os.environ.get('MEDIA_ROOT', BASE_DIR / 'media'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -133,3 +172,16 @@ CSRF_TRUSTED_ORIGINS = os.environ.get('CSRF_TRUSTED_ORIGINS', 'https://electives
 # Session cookie settings
 SESSION_COOKIE_SECURE = not DEBUG
 CSRF_COOKIE_SECURE = not DEBUG
+
+# Prometheus /metrics/ endpoint; scrapers must send
+# "Authorization: Bearer <METRICS_TOKEN>". Without a token the endpoint is
+# only served when DEBUG is on
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Request profiling (courses.middleware.ProfilingMiddleware). When enabled,
+# staff can profile a request with ?_profile=1 or a signed X-Profile header,
+# and requests slower than PROFILE_SLOW_MS (0 = off) are profiled automatically
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+PROFILE_SLOW_MS = int(os.environ.get('PROFILE_SLOW_MS', '0'))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+PROFILE_TOKEN_MAX_AGE = 60 * 60 * 24
@@ -0,0 +1,91 @@
+"""
+Gunicorn configuration, loaded automatically from the working directory.
+
+Each worker is warmed up (hot imports, compiled templates, an open database
+connection) before it accepts traffic; see courses/warmup.py.
+
+The master also starts the background job runner (manage.py run_jobs) as a
+child process in the same container, since it needs the same db.sqlite3 and
+MEDIA_ROOT as the web workers. A thread in the master restarts the runner
+whenever it exits, and it is stopped on shutdown. Set RUN_JOBS=False to run
+it some other way.
+
+Prometheus metrics are shared between workers through mmap'd files in
+PROMETHEUS_MULTIPROC_DIR, which has to exist before any worker imports
+prometheus_client and must be emptied on each (re)start.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(tempfile.gettempdir(), 'electives-prometheus'),
+)
+
+
+def on_starting(server):
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+JOB_RUNNER_RESTART_DELAY = 5
+
+job_runner = None
+job_runner_supervisor = None
+stopping = threading.Event()
+
+
+def supervise_job_runner(server):
+    """Run manage.py run_jobs, restarting it whenever it exits"""
+    global job_runner
+    manage_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'manage.py')
+    while not stopping.is_set():
+        job_runner = subprocess.Popen([sys.executable, manage_py, 'run_jobs'])
+        server.log.info('Started job runner (pid %s)', job_runner.pid)
+        returncode = job_runner.wait()
+        if stopping.is_set():
+            return
+        server.log.error('Job runner exited with status %s, restarting in %s s',
+                         returncode, JOB_RUNNER_RESTART_DELAY)
+        stopping.wait(JOB_RUNNER_RESTART_DELAY)
+
+
+def when_ready(server):
+    global job_runner_supervisor
+    server.log.info('Master ready, spawning workers')
+    if os.environ.get('RUN_JOBS', 'True') == 'True' and job_runner_supervisor is None:
+        job_runner_supervisor = threading.Thread(
+            target=supervise_job_runner, args=(server,), name='job-runner-supervisor', daemon=True,
+        )
+        job_runner_supervisor.start()
+
+
+def on_exit(server):
+    stopping.set()
+    if job_runner is not None and job_runner.poll() is None:
+        job_runner.terminate()
+        try:
+            job_runner.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            job_runner.kill()
+
+
+def post_worker_init(worker):
+    from courses.warmup import warm_up
+    timings = warm_up()
+    worker.log.info(
+        'Worker %s warmed up in %.1f ms (%s)',
+        worker.pid,
+        sum(seconds for _, seconds in timings) * 1000,
+        ', '.join(f'{step}: {seconds * 1000:.1f} ms' for step, seconds in timings),
+    )
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)